@@ -0,0 +1,240 @@
+import asyncio
+import dataclasses
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future, InvalidStateError
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import torch
+import whisper
+from whisper.audio import N_FRAMES, N_SAMPLES
+
+from profiling import profiler
+
+
+@dataclass
+class TranscriptionRequest:
+    audio: np.ndarray
+    prompt: Optional[str]
+    language: Optional[str]
+    future: Future
+
+
+class WhisperEngine:
+    """多個 VoiceStream 共用的 Whisper 模型
+
+    模型只載入一次。背景執行緒會在 batch_window 秒內收集不同來源的語音段，
+    以單次 encoder forward 計算所有 30 秒視窗的特徵。
+    解碼時只有語言與提示都相同的視窗才會合併為同一批；各來源以自己的近期文字作為提示，
+    因此跨來源通常只共用 encoder，decoder 仍逐段執行。
+    """
+
+    def __init__(
+        self,
+        model_name: str = "large-v3-turbo",
+        max_batch: int = 4,
+        batch_window: float = 0.05,
+    ):
+        self.model = self._load_model(model_name)
+        self.fp16 = self.model.device.type == "cuda"
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+
+        # 與 whisper.transcribe 相同的品質門檻
+        self.compression_ratio_threshold = 2.4
+        self.logprob_threshold = -1.0
+        self.no_speech_threshold = 0.6
+
+        self.requests: queue.Queue[TranscriptionRequest] = queue.Queue()
+        self.running = True
+        self.worker_thread = threading.Thread(target=self._run, name="asr", daemon=True)
+        self.worker_thread.start()
+
+    def _load_model(self, model_name: str):
+        return whisper.load_model(model_name)
+
+    def submit(
+        self, audio: np.ndarray, prompt: Optional[str], language: Optional[str]
+    ) -> Future:
+        future = Future()
+        self.requests.put(TranscriptionRequest(audio, prompt, language, future))
+        return future
+
+    async def transcribe(
+        self, audio: np.ndarray, prompt: Optional[str], language: Optional[str]
+    ) -> str:
+        return await asyncio.wrap_future(self.submit(audio, prompt, language))
+
+    def stop(self):
+        self.running = False
+        if self.worker_thread.is_alive():
+            self.worker_thread.join(timeout=2.0)
+        while not self.requests.empty():
+            self.requests.get().future.cancel()
+
+    def _next_request(self, timeout: float) -> Optional[TranscriptionRequest]:
+        """取出下一個請求，略過已被取消的請求"""
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            try:
+                request = self.requests.get(timeout=remaining)
+            except queue.Empty:
+                return None
+            # 標記為執行中後便無法再被取消
+            if request.future.set_running_or_notify_cancel():
+                return request
+
+    def _run(self):
+        while self.running:
+            try:
+                request = self._next_request(0.1)
+                if request is None:
+                    continue
+                batch = [request]
+
+                deadline = time.monotonic() + self.batch_window
+                while len(batch) < self.max_batch:
+                    request = self._next_request(deadline - time.monotonic())
+                    if request is None:
+                        break
+                    batch.append(request)
+
+                try:
+                    texts = self._transcribe_batch(batch)
+                except Exception as e:
+                    print(f"批次辨識出錯: {e}")
+                    if len(batch) == 1:
+                        self._deliver(batch[0], exception=e)
+                        continue
+                    # 逐一重試，只讓真正出錯的請求失敗
+                    for request in batch:
+                        self._retry(request)
+                    continue
+                for request, text in zip(batch, texts):
+                    self._deliver(request, result=text)
+            except Exception as e:
+                # 引擎由所有來源共用，工作執行緒不能因單一錯誤而結束
+                print(f"辨識引擎出錯: {e}")
+
+    def _retry(self, request: TranscriptionRequest):
+        try:
+            (text,) = self._transcribe_batch([request])
+        except Exception as e:
+            print(f"辨識出錯: {e}")
+            self._deliver(request, exception=e)
+            return
+        self._deliver(request, result=text)
+
+    def _deliver(self, request: TranscriptionRequest, result=None, exception=None):
+        try:
+            if exception is not None:
+                request.future.set_exception(exception)
+            else:
+                request.future.set_result(result)
+        except InvalidStateError:
+            pass
+
+    def _decode(
+        self, features: torch.Tensor, language: Optional[str], prompt: Optional[str]
+    ) -> list:
+        options = whisper.DecodingOptions(
+            language=language,
+            prompt=prompt,
+            temperature=0.0,
+            without_timestamps=True,
+            fp16=self.fp16,
+        )
+        results = self.model.decode(features, options)
+
+        if prompt:
+            # 提示可能使模型重複輸出，沿用同一份特徵不帶提示重新解碼
+            retry = [
+                i
+                for i, result in enumerate(results)
+                if result.compression_ratio > self.compression_ratio_threshold
+            ]
+            if retry:
+                retried = self.model.decode(
+                    features[retry], dataclasses.replace(options, prompt=None)
+                )
+                for i, result in zip(retry, retried):
+                    results[i] = result
+
+        return [
+            None
+            if result.no_speech_prob > self.no_speech_threshold
+            and result.avg_logprob < self.logprob_threshold
+            else result
+            for result in results
+        ]
+
+    def _transcribe_batch(self, batch: list[TranscriptionRequest]) -> list[str]:
+        with profiler.torch_region("transcribe"):
+            # 每段語音只計算一次 log-mel，切成 30 秒視窗
+            owners = []
+            windows = []
+            for index, request in enumerate(batch):
+                mel = whisper.log_mel_spectrogram(
+                    request.audio,
+                    self.model.dims.n_mels,
+                    padding=N_SAMPLES,
+                    device=self.model.device,
+                )
+                content_frames = mel.shape[-1] - N_FRAMES
+                for seek in range(0, content_frames, N_FRAMES):
+                    owners.append(index)
+                    windows.append(
+                        whisper.pad_or_trim(mel[:, seek : seek + N_FRAMES], N_FRAMES)
+                    )
+
+            texts = [[] for _ in batch]
+            if not windows:
+                return ["" for _ in batch]
+
+            mel_batch = torch.stack(windows)
+            if self.fp16:
+                mel_batch = mel_batch.half()
+            with torch.no_grad():
+                features = self.model.embed_audio(mel_batch)
+
+            prompts = [request.prompt for request in batch]
+
+            def accept(index: int, result):
+                if result is None:
+                    return
+                texts[index].append(result.text)
+                prompts[index] = " ".join(
+                    filter(None, [prompts[index], result.text.strip()])
+                )
+
+            # 各段的第一個視窗依 (語言, 提示) 分組批次解碼
+            first_windows = {}
+            for window, index in enumerate(owners):
+                first_windows.setdefault(index, window)
+            groups = defaultdict(list)
+            for index, window in first_windows.items():
+                groups[(batch[index].language, batch[index].prompt)].append(window)
+            for (language, prompt), group in groups.items():
+                for window, result in zip(
+                    group, self._decode(features[group], language, prompt)
+                ):
+                    accept(owners[window], result)
+
+            # 超過 30 秒的語音段需延續前一個視窗的文字作為提示，只能依序解碼
+            first = set(first_windows.values())
+            for window, index in enumerate(owners):
+                if window in first:
+                    continue
+                result = self._decode(
+                    features[window : window + 1], batch[index].language, prompts[index]
+                )[0]
+                accept(index, result)
+
+            return ["".join(parts) for parts in texts]
@@ -0,0 +1,544 @@
+"""熱點路徑的微基準測試
+
+量測四個部分:
+- VoiceStream._process_chunk 每個音訊區塊的 VAD 成本 (合成音訊)
+- Emotion.predict 在不同文字長度下的延遲
+- OSC 對本機 UDP 接收端的發送吞吐量
+- process_speech 中語音片段組合、轉換與 log-mel 特徵計算成本
+
+預設以輕量替身取代 whisper / silero-vad / 情緒模型，可在無 GPU、無網路的環境執行。
+結果寫成 JSON，可用 --compare 與舊版本的結果比對。
+
+    python bench.py -o bench_results.json
+    python bench.py --compare old.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Callable
+
+import numpy as np
+import torch
+import whisper
+from whisper.audio import N_SAMPLES
+
+from asr import WhisperEngine
+from emo import Emotion
+from main import OSC
+from voice import VoiceStream, pcm_to_float32
+
+SCHEMA_VERSION = 2
+RATE = 16000
+CHUNK = 1024
+
+
+# ---------------------------------------------------------------------------
+# 量測工具
+# ---------------------------------------------------------------------------
+
+
+def summarize(
+    samples: list[float], unit: str = "s", higher_is_better: bool = False
+) -> dict:
+    return {
+        "unit": unit,
+        "higher_is_better": higher_is_better,
+        "rounds": len(samples),
+        "min": min(samples),
+        "max": max(samples),
+        "mean": statistics.fmean(samples),
+        "median": statistics.median(samples),
+        "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "iqr": iqr(samples),
+    }
+
+
+def iqr(samples: list[float]) -> float:
+    if len(samples) < 2:
+        return 0.0
+    q1, _, q3 = statistics.quantiles(samples, n=4)
+    return q3 - q1
+
+
+def spread(result: dict) -> float:
+    """以 IQR 換算的標準差估計，不受少數極端值影響；舊結果沒有 iqr 時改用 stdev"""
+    if "iqr" in result:
+        return result["iqr"] / 1.349
+    return result.get("stdev", 0.0)
+
+
+def measure(
+    fn: Callable[[], object], rounds: int, warmup: int = 20, min_time: float = 0.5
+) -> dict:
+    """至少執行 rounds 次且累計 min_time 秒，降低單次量測的雜訊"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    total = 0.0
+    while len(samples) < rounds or total < min_time:
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        samples.append(elapsed)
+        total += elapsed
+    return summarize(samples)
+
+
+def primary_value(result: dict) -> float:
+    return result["median"]
+
+
+@contextlib.contextmanager
+def quiet():
+    """程式內大量 print 會影響量測，量測期間丟棄 stdout"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+# ---------------------------------------------------------------------------
+# 模型替身
+# ---------------------------------------------------------------------------
+
+
+def energy_vad(audio: torch.Tensor, model, threshold: float = 0.5, **kwargs):
+    """以能量判斷的 get_speech_timestamps 替身，回傳格式與 silero-vad 相同"""
+    window = 512
+    usable = audio[: len(audio) // window * window]
+    if len(usable) == 0:
+        return []
+    rms = usable.view(-1, window).pow(2).mean(dim=1).sqrt()
+    voiced = torch.nonzero(rms > threshold * 0.05).flatten()
+    if len(voiced) == 0:
+        return []
+    return [{"start": int(voiced[0]) * window, "end": (int(voiced[-1]) + 1) * window}]
+
+
+class StubWhisper:
+    dims = SimpleNamespace(n_mels=128, n_audio_ctx=1500, n_audio_state=8)
+    device = torch.device("cpu")
+
+    def embed_audio(self, mel):
+        return torch.zeros(len(mel), self.dims.n_audio_ctx, self.dims.n_audio_state)
+
+    def decode(self, features, options):
+        return [
+            SimpleNamespace(
+                text="測試", compression_ratio=1.0, avg_logprob=-0.1, no_speech_prob=0.0
+            )
+            for _ in range(len(features))
+        ]
+
+
+class BenchEngine(WhisperEngine):
+    def __init__(self, real_models: bool = False, **kwargs):
+        self.real_models = real_models
+        super().__init__(**kwargs)
+
+    def _load_model(self, model_name: str):
+        if self.real_models:
+            return super()._load_model(model_name)
+        return StubWhisper()
+
+
+class BenchVoiceStream(VoiceStream):
+    def __init__(self, real_models: bool = False, **kwargs):
+        self.real_models = real_models
+        if "engine" not in kwargs:
+            kwargs["engine"] = BenchEngine(
+                real_models, model_name=kwargs.pop("model_name", "large-v3-turbo")
+            )
+        super().__init__(**kwargs)
+
+    def _load_vad(self):
+        if self.real_models:
+            return super()._load_vad()
+        return None, energy_vad
+
+
+class _Encoding(dict):
+    def to(self, device):
+        return _Encoding({k: v.to(device) for k, v in self.items()})
+
+
+class StubTokenizer:
+    max_length = 512
+
+    def __call__(self, text, return_tensors="pt", padding=True, truncation=True):
+        ids = [101] + [ord(c) % 20000 for c in text] + [102]
+        if truncation:
+            ids = ids[: self.max_length]
+        input_ids = torch.tensor([ids])
+        return _Encoding(input_ids=input_ids, attention_mask=torch.ones_like(input_ids))
+
+
+class StubClassifier(torch.nn.Module):
+    """與 Chinese-Emotion-Small 相近形狀的小型 encoder，成本會隨文字長度增加"""
+
+    def __init__(self, hidden: int = 256, labels: int = 8):
+        super().__init__()
+        self.embed = torch.nn.Embedding(20000, hidden)
+        self.encoder = torch.nn.TransformerEncoderLayer(
+            hidden, nhead=4, dim_feedforward=hidden * 4, batch_first=True
+        )
+        self.head = torch.nn.Linear(hidden, labels)
+
+    def forward(self, input_ids, attention_mask=None):
+        hidden = self.encoder(self.embed(input_ids))
+        return SimpleNamespace(logits=self.head(hidden[:, 0]))
+
+
+class BenchEmotion(Emotion):
+    def _load_model(self):
+        torch.manual_seed(0)
+        self.tokenizer = StubTokenizer()
+        self.model = StubClassifier().to(self.device).eval()
+        self.model_loaded = True
+
+
+# ---------------------------------------------------------------------------
+# 合成資料
+# ---------------------------------------------------------------------------
+
+
+def synth_audio(seconds: float, speech: bool, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * RATE)) / RATE
+    signal = rng.normal(0, 0.003, len(t))
+    if speech:
+        envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 4 * t)
+        voice = sum(
+            np.sin(2 * np.pi * f * t) / (i + 1) for i, f in enumerate((180, 360, 720))
+        )
+        signal += 0.3 * envelope * voice
+    return (np.clip(signal, -1, 1) * 32767).astype(np.int16)
+
+
+def to_chunks(audio: np.ndarray) -> list[bytes]:
+    usable = len(audio) // CHUNK * CHUNK
+    return [audio[i : i + CHUNK].tobytes() for i in range(0, usable, CHUNK)]
+
+
+def utterance_chunks(seed: int = 0) -> list[bytes]:
+    """靜音 1 秒、語音 2 秒、靜音 1.5 秒，足以觸發一次完整的語音段"""
+    audio = np.concatenate(
+        [
+            synth_audio(1.0, False, seed),
+            synth_audio(2.0, True, seed + 1),
+            synth_audio(1.5, False, seed + 2),
+        ]
+    )
+    return to_chunks(audio)
+
+
+# ---------------------------------------------------------------------------
+# 基準項目
+# ---------------------------------------------------------------------------
+
+
+def bench_vad(real_models: bool, repeats: int) -> dict:
+    # 只量測 VAD，辨識引擎一律使用替身，避免載入用不到的 Whisper 模型
+    engine = BenchEngine(real_models=False)
+    with quiet():
+        voice = BenchVoiceStream(real_models, engine=engine)
+    chunks = utterance_chunks()
+    samples = []
+    try:
+        with quiet():
+            # 第一輪僅作為暖機
+            for chunk in chunks:
+                voice._process_chunk(chunk)
+            for _ in range(repeats):
+                for chunk in chunks:
+                    start = time.perf_counter()
+                    voice._process_chunk(chunk)
+                    samples.append(time.perf_counter() - start)
+    finally:
+        engine.stop()
+    result = summarize(samples)
+    result["segments_emitted"] = voice.audio_queue.qsize()
+    return {"vad.process_chunk": result}
+
+
+def load_emotion(real_models: bool) -> Emotion:
+    """建立情緒分析器並等待模型載入完成"""
+    analyzer = Emotion() if real_models else BenchEmotion()
+    deadline = time.monotonic() + 300
+    while not analyzer.is_ready():
+        if analyzer.get_loading_error() or time.monotonic() > deadline:
+            raise RuntimeError(f"情緒模型載入失敗: {analyzer.get_loading_error()}")
+        time.sleep(0.05)
+    return analyzer
+
+
+def bench_emotion(real_models: bool, rounds: int) -> dict:
+    with quiet():
+        analyzer = load_emotion(real_models)
+
+    base = "今天天氣很好我們一起去公園散步吧"
+    results = {}
+    for length in (8, 32, 128, 512):
+        text = (base * (length // len(base) + 1))[:length]
+        results[f"emotion.predict[{length}]"] = measure(
+            lambda: analyzer.predict(text), rounds
+        )
+    analyzer.executor.shutdown(wait=False)
+    return results
+
+
+class UdpSink:
+    """計算收到的 UDP 封包數的本機接收端"""
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.settimeout(0.1)
+        self.port = self.sock.getsockname()[1]
+        self.count = 0
+        self.last_arrival = 0.0
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while self.running:
+            try:
+                self.sock.recvfrom(65535)
+                self.last_arrival = time.perf_counter()
+                self.count += 1
+            except socket.timeout:
+                continue
+
+    def wait_for(self, count: int, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while self.count < count and time.monotonic() < deadline:
+            time.sleep(0.0005)
+        return self.count >= count
+
+    def close(self):
+        self.running = False
+        self.thread.join(timeout=1.0)
+        self.sock.close()
+
+
+def bench_osc(messages: int, rounds: int) -> dict:
+    results = {}
+    text = "這是一段測試用的聊天框訊息"
+
+    sink = UdpSink()
+    osc = OSC("127.0.0.1", sink.port)
+    try:
+        # 直接發送的吞吐量，分 rounds 批量測以取得批次間的變異
+        rates = []
+        with quiet():
+            # 第一批作為暖機，不列入結果
+            for batch in range(rounds + 1):
+                sink.count = 0
+                start = time.perf_counter()
+                for _ in range(messages):
+                    osc._send_message(text)
+                sink.wait_for(messages, timeout=5.0)
+                if batch:
+                    rates.append(sink.count / (time.perf_counter() - start))
+        results["osc.send_direct"] = summarize(rates, "msg/s", higher_is_better=True)
+
+        # 經由 send_message 佇列與背景執行緒，每則訊息從進入佇列到送上網路的延遲
+        latencies = []
+        with quiet():
+            for _ in range(max(rounds, 50)):
+                sink.count = 0
+                start = time.perf_counter()
+                osc.send_message(text)
+                if sink.wait_for(1, timeout=1.0):
+                    latencies.append(sink.last_arrival - start)
+        results["osc.queue_latency"] = summarize(latencies)
+    finally:
+        osc.close()
+        sink.close()
+    return results
+
+
+def bench_segments(rounds: int) -> dict:
+    results = {}
+    for seconds in (1, 5, 15):
+        frames = to_chunks(synth_audio(seconds, True))
+        results[f"segment.assemble[{seconds}s]"] = measure(
+            lambda: pcm_to_float32(b"".join(frames)), rounds
+        )
+        audio_np = pcm_to_float32(b"".join(frames))
+        results[f"segment.features[{seconds}s]"] = measure(
+            lambda: whisper.log_mel_spectrogram(audio_np, 128, padding=N_SAMPLES),
+            rounds,
+        )
+    return results
+
+
+# ---------------------------------------------------------------------------
+# 結果輸出與比較
+# ---------------------------------------------------------------------------
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def collect_meta(real_models: bool) -> dict:
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "torch": torch.__version__,
+        "numpy": np.__version__,
+        "torch_threads": torch.get_num_threads(),
+        "real_models": real_models,
+    }
+
+
+def format_value(result: dict) -> str:
+    value = primary_value(result)
+    if result["unit"] == "s":
+        return f"{value * 1e6:10.1f} us"
+    return f"{value:10.1f} {result['unit']}"
+
+
+def print_results(results: dict):
+    width = max(len(name) for name in results)
+    for name, result in results.items():
+        print(f"{name:<{width}}  {format_value(result)}")
+
+
+def baseline_stats(baselines: list[dict], name: str) -> tuple[float, float] | None:
+    """回傳基準的中位數與雜訊估計
+
+    有多份基準時以各次執行中位數的標準差估計執行間的變異，
+    只有一份時退而使用該次執行內的離散程度 (IQR)。
+    """
+    results = [b["results"][name] for b in baselines if name in b.get("results", {})]
+    results = [r for r in results if "median" in r]
+    if not results:
+        return None
+    medians = [primary_value(r) for r in results]
+    if len(medians) > 1:
+        return statistics.fmean(medians), statistics.stdev(medians)
+    return medians[0], spread(results[0])
+
+
+def compare(
+    baselines: list[dict], current: dict, threshold: float, noise_k: float
+) -> list[str]:
+    """印出與基準結果的差異，回傳退步的項目
+
+    中位數變化需同時超過 threshold 比例與 noise_k 倍的合併雜訊 (基準與本次的離散程度)，
+    才視為退步，避免同一版本重複執行時的雜訊被誤判。
+    """
+    regressions = []
+    width = max(len(name) for name in current["results"])
+    revisions = ", ".join(str(b.get("meta", {}).get("git_revision")) for b in baselines)
+    print(f"\n與 {revisions} 比較:")
+    if len(baselines) == 1:
+        print("只有一份基準，雜訊僅以單次執行內的 IQR 估計，可能低估執行間的變異")
+    for name, result in current["results"].items():
+        stats = baseline_stats(baselines, name)
+        if stats is None:
+            print(f"{name:<{width}}  (新項目)")
+            continue
+        old, old_noise = stats
+        new = primary_value(result)
+        if not old:
+            continue
+        change = (new - old) / old
+        delta = old - new if result["higher_is_better"] else new - old
+        noise = math.hypot(old_noise, spread(result))
+        mark = ""
+        if delta / old > threshold and delta > noise_k * noise:
+            mark = "  REGRESSION"
+            regressions.append(name)
+        elif delta / old > threshold:
+            mark = "  (在雜訊範圍內)"
+        print(f"{name:<{width}}  {change:+8.1%}{mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="熱點路徑微基準測試")
+    parser.add_argument("-o", "--output", default="bench_results.json")
+    parser.add_argument(
+        "--compare",
+        nargs="+",
+        metavar="JSON",
+        help="用來比較的舊結果，多份時以其間的差異估計執行間雜訊",
+    )
+    parser.add_argument(
+        "--threshold", type=float, default=0.10, help="視為退步的比例 (預設 0.10)"
+    )
+    parser.add_argument(
+        "--noise-k",
+        type=float,
+        default=2.0,
+        help="退步幅度需超過合併離散程度的倍數 (預設 2.0)",
+    )
+    parser.add_argument(
+        "--real-models", action="store_true", help="載入真實模型而非替身 (需要網路)"
+    )
+    parser.add_argument("--quick", action="store_true", help="減少量測次數")
+    args = parser.parse_args()
+
+    # 先讀入基準結果，並避免輸出覆蓋掉正在比較的檔案
+    baselines = []
+    for path in args.compare or []:
+        if os.path.abspath(path) == os.path.abspath(args.output):
+            parser.error("--output 不可與 --compare 為同一個檔案")
+        with open(path, encoding="utf-8") as f:
+            baselines.append(json.load(f))
+
+    rounds = 50 if args.quick else 300
+    results = {}
+    results.update(bench_vad(args.real_models, repeats=2 if args.quick else 10))
+    results.update(bench_emotion(args.real_models, rounds))
+    results.update(
+        # 每批訊息數固定，--quick 與完整執行的吞吐量才能互相比較
+        bench_osc(messages=1000, rounds=5 if args.quick else 20)
+    )
+    results.update(bench_segments(rounds))
+
+    report = {
+        "schema": SCHEMA_VERSION,
+        "meta": collect_meta(args.real_models),
+        "results": results,
+    }
+    print_results(results)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\n結果已寫入 {args.output}")
+
+    if baselines:
+        if compare(baselines, report, args.threshold, args.noise_k):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@ import asyncio
 from transformers import AutoTokenizer, AutoModelForSequenceClassification  # type: ignore
 import torch
 from concurrent.futures import ThreadPoolExecutor
+from profiling import profiler
 
 
 # 0: "平淡語氣"
@@ -21,7 +22,7 @@ class Emotion:
         print(f"Emotion analysis using device: {self.device}")
         self.model_loaded = False
         self.loading_error = None
-        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="emotion")
 
         self.executor.submit(self._load_model)
 
@@ -53,11 +54,12 @@ class Emotion:
         if not self.model_loaded:
             raise RuntimeError("情緒分析模型尚未載入完成")
 
-        inputs = self.tokenizer(
-            text, return_tensors="pt", padding=True, truncation=True
-        ).to(self.device)
-        with torch.no_grad():
-            outputs = self.model(**inputs)
+        with profiler.torch_region("emotion"):
+            inputs = self.tokenizer(
+                text, return_tensors="pt", padding=True, truncation=True
+            ).to(self.device)
+            with torch.no_grad():
+                outputs = self.model(**inputs)
         predicted_class = int(torch.argmax(outputs.logits).item())
         return predicted_class
 
@@ -0,0 +1,319 @@
+"""OSC 端到端送達與負載測試
+
+經由應用程式的 OSC 佇列發送文字 (或重播音訊經過 VAD、辨識與 main.route_speech)，
+由 osc_server.LoopbackServer 接收，統計送達、丟棄、延遲的訊息數與延遲百分位數。
+文字模式的延遲從進入 OSC 佇列起算，音訊模式則從 VAD 判定語音段結束起算。
+
+    python loadtest.py --count 50 --rate 5
+    python loadtest.py --audio synthetic --repeat 3 --streams 2
+    python loadtest.py --audio sample.wav --real-models --face
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import queue
+import threading
+import time
+import wave
+from collections import defaultdict, deque
+
+import numpy as np
+
+from bench import (
+    CHUNK,
+    RATE,
+    BenchEngine,
+    BenchVoiceStream,
+    load_emotion,
+    to_chunks,
+    utterance_chunks,
+)
+from main import OSC, route_speech
+from osc_server import DELIVERED, TRUNCATED, LoopbackServer
+
+
+class DeliveryTracker:
+    """記錄每則訊息的起算時間，以便與接收端的抵達時間配對"""
+
+    def __init__(self):
+        self.pending: dict[str, deque[float]] = defaultdict(deque)
+        self.sent = 0
+        self.lock = threading.Lock()
+
+    def mark_sent(self, text: str, sent_at: float | None = None):
+        with self.lock:
+            self.pending[text].append(sent_at or time.time())
+            self.sent += 1
+
+    def match(self, text: str) -> float | None:
+        with self.lock:
+            queue = self.pending.get(text)
+            if queue:
+                return queue.popleft()
+        return None
+
+
+class SegmentQueue(queue.Queue):
+    """VoiceStream.audio_queue 的替代品，記錄每段語音放入佇列 (語音段結束) 的時間
+
+    process_speech 依序處理各段，因此回呼時 current 即為該段的結束時間。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.current: float | None = None
+
+    def _put(self, item):
+        super()._put((item, time.time()))
+
+    def _get(self):
+        item, self.current = super()._get()
+        return item
+
+
+class TrackedOSC:
+    """轉送給 OSC，並將實際送出的文字以語音段結束時間登記到 tracker"""
+
+    def __init__(self, osc: OSC, tracker: DeliveryTracker, segment_end: float | None):
+        self.osc = osc
+        self.tracker = tracker
+        self.segment_end = segment_end
+
+    def send_message(self, message: str):
+        self.tracker.mark_sent(message, self.segment_end)
+        self.osc.send_message(message)
+
+    def _change_face(self, face_id: int):
+        self.osc._change_face(face_id)
+
+
+def generate_texts(count: int) -> list[str]:
+    lengths = (12, 48, 160)
+    base = "這是一段負載測試用的聊天框訊息"
+    texts = []
+    for i in range(count):
+        length = lengths[i % len(lengths)]
+        body = (base * (length // len(base) + 1))[:length]
+        texts.append(f"#{i} {body}")
+    return texts
+
+
+def load_wav_chunks(path: str) -> list[bytes]:
+    with wave.open(path, "rb") as wf:
+        if wf.getframerate() != RATE or wf.getnchannels() != 1 or wf.getsampwidth() != 2:
+            raise ValueError(f"{path} 需為 {RATE} Hz、單聲道、16-bit PCM")
+        audio = np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16)
+    return to_chunks(audio)
+
+
+def drive_text(osc: OSC, tracker: DeliveryTracker, texts: list[str], rate: float, face):
+    interval = 1.0 / rate if rate > 0 else 0.0
+    for i, text in enumerate(texts):
+        tracker.mark_sent(text)
+        osc.send_message(text)
+        if face:
+            osc._change_face(i % 8)
+        if interval:
+            time.sleep(interval)
+
+
+def drive_audio(
+    osc: OSC,
+    tracker: DeliveryTracker,
+    chunks: list[bytes],
+    speed: float,
+    real_models: bool,
+    model_name: str,
+    language: str,
+    streams: int,
+    face: bool,
+):
+    """將音訊區塊依 speed 倍速送入共用同一引擎的多個 VoiceStream，
+    辨識結果與應用程式相同經 route_speech 發送 (第一個來源為主要來源)"""
+
+    engine = BenchEngine(real_models, model_name=model_name)
+    voices = {
+        f"src{i}": BenchVoiceStream(
+            real_models, language=language, source=f"src{i}", engine=engine
+        )
+        for i in range(streams)
+    }
+    primary_source = "src0"
+    analyzer = load_emotion(real_models) if face else None
+    predict_face = analyzer.predict if analyzer else None
+
+    def on_speech_detected(text, source):
+        segment_end = voices[source].audio_queue.current
+        route_speech(
+            TrackedOSC(osc, tracker, segment_end),
+            text,
+            source,
+            primary_source,
+            predict_face,
+        )
+
+    for voice in voices.values():
+        voice.audio_queue = SegmentQueue()
+        voice.callback = on_speech_detected
+        voice.is_running = True
+
+    async def process_all():
+        await asyncio.gather(*(voice.process_speech() for voice in voices.values()))
+
+    speech_thread = threading.Thread(
+        target=lambda: asyncio.run(process_all()), daemon=True
+    )
+    speech_thread.start()
+
+    interval = CHUNK / RATE / speed if speed > 0 else 0.0
+    for chunk in chunks:
+        for voice in voices.values():
+            voice._process_chunk(chunk)
+        if interval:
+            time.sleep(interval)
+
+    while any(not voice.audio_queue.empty() for voice in voices.values()):
+        time.sleep(0.1)
+    # 等待最後一段辨識完成
+    time.sleep(0.5)
+    for voice in voices.values():
+        voice.is_running = False
+    speech_thread.join(timeout=60)
+    engine.stop()
+    if analyzer:
+        analyzer.executor.shutdown(wait=False)
+
+
+def build_report(server: LoopbackServer, tracker: DeliveryTracker, threshold: float):
+    latencies = []
+    counts = defaultdict(int)
+    delayed = 0
+    for message in server.received("/chatbox/input"):
+        counts[message.status] += 1
+        sent_at = tracker.match(str(message.args[0]))
+        if sent_at is None:
+            continue
+        latency = message.timestamp - sent_at
+        latencies.append(latency)
+        if message.status in (DELIVERED, TRUNCATED) and latency > threshold:
+            delayed += 1
+
+    received = sum(counts.values())
+    shown = counts[DELIVERED] + counts[TRUNCATED]
+    report = {
+        "sent": tracker.sent,
+        "received": received,
+        "delivered": shown,
+        "truncated": counts[TRUNCATED],
+        "dropped": tracker.sent - shown,
+        "rate_limited": counts["rate_limited"],
+        "lost": tracker.sent - received,
+        "delayed": delayed,
+        "delay_threshold": threshold,
+        "avatar_parameters": server.summary()["avatar_parameters"],
+    }
+    if latencies:
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+        report["latency"] = {
+            "p50": float(p50),
+            "p90": float(p90),
+            "p99": float(p99),
+            "max": float(max(latencies)),
+        }
+    return report
+
+
+def print_report(report: dict):
+    print(f"發送: {report['sent']}  接收: {report['received']}")
+    print(
+        f"顯示: {report['delivered']} (截斷 {report['truncated']})  "
+        f"丟棄: {report['dropped']} (頻率限制 {report['rate_limited']}, "
+        f"遺失 {report['lost']})"
+    )
+    print(f"延遲超過 {report['delay_threshold']:.2f} 秒: {report['delayed']}")
+    if "latency" in report:
+        latency = report["latency"]
+        print(
+            "延遲 (ms): " + "  ".join(f"{k}={v * 1000:.1f}" for k, v in latency.items())
+        )
+    if report["avatar_parameters"]:
+        print(f"Avatar 參數: {report['avatar_parameters']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OSC 端到端送達與負載測試")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="接收端埠號 (0 為自動)")
+    parser.add_argument("--count", type=int, default=30, help="文字模式的訊息數")
+    parser.add_argument("--rate", type=float, default=0, help="每秒訊息數 (0 為不限)")
+    parser.add_argument("--text-file", help="逐行讀取要發送的文字")
+    parser.add_argument(
+        "--face",
+        action="store_true",
+        help="改變表情 (音訊模式經由情緒分析，文字模式依序切換)",
+    )
+    parser.add_argument("--audio", help="重播的 wav 檔 (16 kHz 單聲道)，或 synthetic")
+    parser.add_argument("--repeat", type=int, default=1, help="音訊重播次數")
+    parser.add_argument(
+        "--speed", type=float, default=1.0, help="音訊重播倍速 (0 為不限)"
+    )
+    parser.add_argument(
+        "--streams", type=int, default=1, help="共用同一辨識引擎的音訊來源數"
+    )
+    parser.add_argument("--real-models", action="store_true")
+    parser.add_argument("--model", default="large-v3-turbo")
+    parser.add_argument("--language", default="zh")
+    parser.add_argument("--delay-threshold", type=float, default=1.0)
+    parser.add_argument("--drain", type=float, default=3.0, help="結束前等待秒數")
+    parser.add_argument("--json", help="將結果寫入 JSON 檔")
+    args = parser.parse_args()
+
+    server = LoopbackServer(args.host, args.port).start()
+    osc = OSC(server.host, server.port)
+    tracker = DeliveryTracker()
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            if args.audio:
+                if args.audio == "synthetic":
+                    chunks = utterance_chunks()
+                else:
+                    chunks = load_wav_chunks(args.audio)
+                drive_audio(
+                    osc,
+                    tracker,
+                    chunks * args.repeat,
+                    args.speed,
+                    args.real_models,
+                    args.model,
+                    args.language,
+                    args.streams,
+                    args.face,
+                )
+            else:
+                if args.text_file:
+                    with open(args.text_file, encoding="utf-8") as f:
+                        texts = [line.strip() for line in f if line.strip()]
+                else:
+                    texts = generate_texts(args.count)
+                drive_text(osc, tracker, texts, args.rate, args.face)
+
+            deadline = time.monotonic() + args.drain
+            while not osc.message_queue.empty() or time.monotonic() < deadline:
+                time.sleep(0.05)
+    finally:
+        osc.close()
+        server.close()
+
+    report = build_report(server, tracker, args.delay_threshold)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,26 @@
+import argparse
 import asyncio
+import pyaudio
 import threading
 import time
 from pythonosc import udp_client
 from queue import Queue
 from ui import VoiceToTextApp
 from voice import VoiceStream
+from asr import WhisperEngine
 from emo import Emotion
+from profiling import profiler
 
 
 class OSC:
-    def __init__(self):
-        self.client = udp_client.SimpleUDPClient("127.0.0.1", 9000)
+    def __init__(self, host: str = "127.0.0.1", port: int = 9000):
+        self.client = udp_client.SimpleUDPClient(host, port)
         self.running = True
         self.message_queue = Queue()
         self.loop = asyncio.new_event_loop()
-        self.worker_thread = threading.Thread(target=self._process_messages, daemon=True)
+        self.worker_thread = threading.Thread(
+            target=self._process_messages, name="osc", daemon=True
+        )
         self.worker_thread.start()
 
     def _process_messages(self):
@@ -59,13 +65,55 @@ class OSC:
             pass
 
 
+def route_speech(
+    osc: OSC, text: str, source: str, primary_source: str, predict_face=None
+):
+    """將辨識結果送往 VRChat
+
+    非主要來源的文字加上 [來源] 標籤；主要來源提供 predict_face 時，
+    於背景執行緒完成情緒分析後送出文字並改變表情。
+    """
+    if source != primary_source:
+        osc.send_message(f"[{source}] {text}")
+    elif predict_face is None:
+        osc.send_message(text)
+    else:
+        threading.Thread(
+            target=_send_with_face, args=(osc, text, predict_face), daemon=True
+        ).start()
+
+
+def _send_with_face(osc: OSC, text: str, predict_face):
+    try:
+        face_id = predict_face(text)
+        osc.send_message(text)
+        if face_id is not None:
+            osc._change_face(face_id)
+    except Exception as e:
+        print(f"發送消息時出錯: {e}")
+
+
 class VRChatVoiceToText:
-    def __init__(self):
-        self.osc = OSC()
+    def __init__(
+        self,
+        osc_host: str = "127.0.0.1",
+        osc_port: int = 9000,
+        sources: list[tuple[str, int]] | None = None,
+    ):
+        self.osc = OSC(osc_host, osc_port)
         self.app = VoiceToTextApp()
         self.app.BINDINGS.append(("ctrl+q", "exit_app", "退出應用"))
         self.app.action_exit_app = self.exit_app  # type: ignore
-        self.voice = VoiceStream(model_name="large-v3-turbo", language="zh")
+        sources = sources or [("mic", 0)]
+        # 第一個來源為使用者本人，只有它會驅動表情
+        self.primary_source = sources[0][0]
+        self.engine = WhisperEngine(model_name="large-v3-turbo")
+        self.voices = [
+            VoiceStream(
+                language="zh", source=name, device_index=index, engine=self.engine
+            )
+            for name, index in sources
+        ]
         self.running = True
         self.voice_task = None
         self.emotion_loaded = False
@@ -125,33 +173,25 @@ class VRChatVoiceToText:
             print(f"情緒分析出錯: {e}")
             return None
 
-    def on_speech_detected(self, text):
+    def on_speech_detected(self, text, source):
         """處理語音辨識結果"""
-        self.app.call_from_thread(self.app.add_speech_text, text)
+        self.app.call_from_thread(self.app.add_speech_text, text, source)
+        if not self.app.osc_enabled:
+            return
 
+        predict_face = None
         if self.app.emotion_enabled and self.emotion_loaded:
-            threading.Thread(
-                target=self._process_emotion_and_send, args=(text,), daemon=True
-            ).start()
-        elif self.app.osc_enabled:
-            self.osc.send_message(text)
+            predict_face = self._predict_face
+        route_speech(self.osc, text, source, self.primary_source, predict_face)
 
-    def _process_emotion_and_send(self, text):
+    def _predict_face(self, text):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
         try:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                emotion_result = loop.run_until_complete(self.analyze_emotion(text))
-                if self.app.osc_enabled:
-                    self.osc.send_message(text)
-                    if emotion_result and self.app.emotion_enabled:
-                        face_id = emotion_result["face_id"]
-                        self.osc._change_face(face_id)
-            finally:
-                loop.close()
-
-        except Exception as e:
-            print(f"發送消息時出錯: {e}")
+            emotion_result = loop.run_until_complete(self.analyze_emotion(text))
+        finally:
+            loop.close()
+        return emotion_result["face_id"] if emotion_result else None
 
     def handle_text_input(self, text):
         """處理文字輸入"""
@@ -177,18 +217,19 @@ class VRChatVoiceToText:
                 print(f"情緒辨識已{'啟用' if value else '停用'}")
 
     async def run_voice_recognition(self):
-        self.voice.start_stream(callback=self.on_speech_detected)
+        for voice in self.voices:
+            voice.start_stream(callback=self.on_speech_detected)
 
         try:
-            await self.voice.process_speech()
+            await asyncio.gather(*(voice.process_speech() for voice in self.voices))
         except Exception as e:
             self.app.call_from_thread(
                 self.app.add_error_message,
                 f"語音辨識出錯: {e}",
             )
         finally:
-            if self.voice:
-                self.voice.stop_stream()
+            for voice in self.voices:
+                voice.stop_stream()
 
     def start_voice_thread(self):
         """在背景啟動異步語音處理"""
@@ -199,12 +240,39 @@ class VRChatVoiceToText:
             self.voice_task = loop.create_task(self.run_voice_recognition())
             loop.run_until_complete(self.voice_task)
 
-        self.voice_thread = threading.Thread(target=run_async_loop, daemon=True)
+        self.voice_thread = threading.Thread(
+            target=run_async_loop, name="voice", daemon=True
+        )
         self.voice_thread.start()
 
+    def toggle_profiling(self):
+        """開始或停止效能分析"""
+        if profiler.stopping:
+            self.app.add_system_message("效能分析結果寫入中，請稍候")
+        elif profiler.active:
+            self.app.add_system_message("正在停止效能分析...")
+            threading.Thread(target=self._stop_profiling, daemon=True).start()
+        else:
+            prefix = profiler.start()
+            self.app.add_system_message(f"效能分析已開始: {prefix}")
+
+    def _stop_profiling(self):
+        """在背景寫出效能分析結果，避免阻塞介面"""
+        try:
+            outputs = profiler.stop()
+            self.app.call_from_thread(
+                self.app.add_system_message,
+                f"效能分析已停止，輸出 {len(outputs)} 個檔案至 {profiler.output_dir}",
+            )
+        except Exception as e:
+            self.app.call_from_thread(
+                self.app.add_error_message, f"寫出效能分析結果失敗: {e}"
+            )
+
     def setup_ui_callbacks(self):
         self.app.on_input_submitted = self.handle_text_input  # type: ignore
         self.app.on_settings_changed = self.handle_settings_changed  # type: ignore
+        self.app.on_toggle_profiling = self.toggle_profiling  # type: ignore
 
     def start(self):
         """啟動整個應用程式"""
@@ -216,9 +284,10 @@ class VRChatVoiceToText:
         """安全關閉應用程式的所有部分"""
         print("正在關閉應用程式...")
 
-        if self.voice:
+        if self.voices:
             print("正在停止語音服務...")
-            self.voice.is_running = False
+            for voice in self.voices:
+                voice.is_running = False
 
             if hasattr(self, "voice_task") and self.voice_task:
                 print("正在取消語音處理任務...")
@@ -243,6 +312,12 @@ class VRChatVoiceToText:
             if self.voice_thread.is_alive():
                 print("語音線程未在預期時間內結束")
 
+        print("正在停止辨識引擎...")
+        self.engine.stop()
+
+        if profiler.active:
+            profiler.stop()
+
         if self.osc:
             print("正在關閉OSC服務...")
             try:
@@ -257,8 +332,62 @@ class VRChatVoiceToText:
         print("程式已完全關閉")
 
 
+def parse_source(spec: str) -> tuple[str, int]:
+    """解析 NAME:DEVICE 形式的音訊來源"""
+    name, sep, index = spec.rpartition(":")
+    if not sep or not name:
+        raise argparse.ArgumentTypeError(f"需為 NAME:DEVICE 格式: {spec!r}")
+    try:
+        device_index = int(index)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"裝置編號需為整數: {spec!r}") from None
+    if device_index < 0:
+        raise argparse.ArgumentTypeError(f"裝置編號不可為負數: {spec!r}")
+    return name, device_index
+
+
+def list_input_devices():
+    audio = pyaudio.PyAudio()
+    try:
+        for i in range(audio.get_device_count()):
+            info = audio.get_device_info_by_index(i)
+            if info["maxInputChannels"] > 0:
+                print(f"{i}: {info['name']}")
+    finally:
+        audio.terminate()
+
+
 def main():
-    app = VRChatVoiceToText()
+    parser = argparse.ArgumentParser(description="VRChat 語音轉文字 OSC")
+    parser.add_argument("--osc-host", default="127.0.0.1", help="OSC 目標主機")
+    parser.add_argument("--osc-port", type=int, default=9000, help="OSC 目標埠號")
+    parser.add_argument(
+        "--source",
+        action="append",
+        type=parse_source,
+        metavar="NAME:DEVICE",
+        help="音訊來源名稱與輸入裝置編號，可重複指定 (預設 mic:0)",
+    )
+    parser.add_argument("--list-devices", action="store_true", help="列出輸入裝置")
+    parser.add_argument(
+        "--profile-dir", default="profiles", help="效能分析輸出目錄 (F8 或 SIGUSR1 切換)"
+    )
+    args = parser.parse_args()
+
+    if args.list_devices:
+        list_input_devices()
+        return
+
+    sources = args.source or [("mic", 0)]
+    names = [name for name, _ in sources]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        parser.error(f"音訊來源名稱重複: {', '.join(duplicates)}")
+
+    profiler.output_dir = args.profile_dir
+    profiler.install_signal_handler()
+
+    app = VRChatVoiceToText(args.osc_host, args.osc_port, sources)
 
     try:
         app.start()
@@ -0,0 +1,183 @@
+"""模擬 VRChat 的本機 OSC 接收端
+
+記錄 /chatbox/input、/chatbox/typing 與 /avatar/parameters/* 的訊息與抵達時間，
+並套用類似 VRChat 的聊天框限制 (字數上限與發送頻率)，用來驗證實際能送達的內容。
+
+    python osc_server.py --port 9000
+"""
+
+import argparse
+import threading
+import time
+from dataclasses import dataclass
+
+from pythonosc.dispatcher import Dispatcher
+from pythonosc.osc_server import BlockingOSCUDPServer
+
+# VRChat 聊天框的字數上限
+CHATBOX_MAX_CHARS = 144
+# VRChat 未公開確切的頻率限制，這裡以 token bucket 近似:
+# 最多連發 5 則，之後每 1.5 秒補 1 則
+CHATBOX_BURST = 5
+CHATBOX_REFILL_SECONDS = 1.5
+
+# 訊息狀態
+DELIVERED = "delivered"
+TRUNCATED = "truncated"
+RATE_LIMITED = "rate_limited"
+KEYBOARD = "keyboard"
+
+
+@dataclass
+class ReceivedMessage:
+    address: str
+    args: tuple
+    timestamp: float
+    status: str = DELIVERED
+    displayed: str | None = None
+
+
+class ChatboxLimiter:
+    """聊天框頻率限制 (token bucket)"""
+
+    def __init__(
+        self, burst: int = CHATBOX_BURST, refill_seconds: float = CHATBOX_REFILL_SECONDS
+    ):
+        self.burst = burst
+        self.refill_seconds = refill_seconds
+        self.tokens = float(burst)
+        self.updated = time.time()
+
+    def allow(self, now: float) -> bool:
+        if self.refill_seconds > 0:
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) / self.refill_seconds
+            )
+        else:
+            self.tokens = float(self.burst)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class LoopbackServer:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 9000,
+        max_chars: int = CHATBOX_MAX_CHARS,
+        burst: int = CHATBOX_BURST,
+        refill_seconds: float = CHATBOX_REFILL_SECONDS,
+        on_message=None,
+    ):
+        self.max_chars = max_chars
+        self.limiter = ChatboxLimiter(burst, refill_seconds)
+        self.on_message = on_message
+        self.messages: list[ReceivedMessage] = []
+        self.lock = threading.Lock()
+
+        self.dispatcher = Dispatcher()
+        self.dispatcher.map("/chatbox/input", self._on_chatbox_input)
+        self.dispatcher.map("/chatbox/typing", self._on_typing)
+        self.dispatcher.set_default_handler(self._on_other)
+
+        self.server = BlockingOSCUDPServer((host, port), self.dispatcher)
+        self.host, self.port = self.server.server_address[:2]
+        self.server_thread = None
+
+    def start(self):
+        self.server_thread = threading.Thread(
+            target=self.server.serve_forever, daemon=True
+        )
+        self.server_thread.start()
+        return self
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.server_thread:
+            self.server_thread.join(timeout=1.0)
+
+    def _record(self, message: ReceivedMessage):
+        with self.lock:
+            self.messages.append(message)
+        if self.on_message:
+            self.on_message(message)
+
+    def _on_chatbox_input(self, address: str, *args):
+        now = time.time()
+        text = str(args[0]) if args else ""
+        immediate = bool(args[1]) if len(args) > 1 else False
+        message = ReceivedMessage(address, args, now)
+
+        if not immediate:
+            # 未設定立即發送時只會填入鍵盤，不會顯示在聊天框
+            message.status = KEYBOARD
+        elif not self.limiter.allow(now):
+            message.status = RATE_LIMITED
+        else:
+            message.displayed = text[: self.max_chars]
+            if len(text) > self.max_chars:
+                message.status = TRUNCATED
+        self._record(message)
+
+    def _on_typing(self, address: str, *args):
+        self._record(ReceivedMessage(address, args, time.time()))
+
+    def _on_other(self, address: str, *args):
+        if address.startswith("/avatar/parameters/"):
+            self._record(ReceivedMessage(address, args, time.time()))
+
+    def received(self, address: str | None = None) -> list[ReceivedMessage]:
+        with self.lock:
+            if address is None:
+                return list(self.messages)
+            return [m for m in self.messages if m.address == address]
+
+    def summary(self) -> dict:
+        counts: dict[str, int] = {}
+        for message in self.received("/chatbox/input"):
+            counts[message.status] = counts.get(message.status, 0) + 1
+        return {
+            "chatbox": counts,
+            "typing": len(self.received("/chatbox/typing")),
+            "avatar_parameters": len(
+                [
+                    m
+                    for m in self.received()
+                    if m.address.startswith("/avatar/parameters/")
+                ]
+            ),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模擬 VRChat 的 OSC 接收端")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--max-chars", type=int, default=CHATBOX_MAX_CHARS)
+    parser.add_argument("--burst", type=int, default=CHATBOX_BURST)
+    parser.add_argument("--refill", type=float, default=CHATBOX_REFILL_SECONDS)
+    args = parser.parse_args()
+
+    def show(message: ReceivedMessage):
+        stamp = time.strftime("%H:%M:%S", time.localtime(message.timestamp))
+        print(f"[{stamp}] {message.address} {message.args} ({message.status})")
+
+    server = LoopbackServer(
+        args.host, args.port, args.max_chars, args.burst, args.refill, on_message=show
+    )
+    print(f"OSC 接收端已啟動: {server.host}:{server.port}")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server.server_close()
+        print(server.summary())
+
+
+if __name__ == "__main__":
+    main()
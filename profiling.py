@@ -0,0 +1,226 @@
+"""執行中可切換的效能分析
+
+開啟後同時進行三種擷取，關閉時將結果寫入帶時間戳記的檔案:
+- 取樣式 Python profiler，定期記錄所有執行緒 (capture / voice / osc / emotion) 的呼叫堆疊
+- torch.profiler，記錄 model.transcribe 與 Emotion.predict 的 trace
+- tracemalloc 記憶體快照
+
+未開啟時 torch_region 只回傳共用的 nullcontext，幾乎沒有額外成本。
+"""
+
+import contextlib
+import os
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+
+import torch
+
+_NULL_CONTEXT = contextlib.nullcontext()
+
+
+class StackSampler:
+    """以固定間隔讀取 sys._current_frames() 的取樣式 profiler"""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.stacks.clear()
+        self.samples = 0
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=1.0)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while self.running:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    filename = os.path.basename(code.co_filename)
+                    stack.append(f"{code.co_name} ({filename}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+            time.sleep(self.interval)
+
+    def write(self, prefix: str) -> list[str]:
+        """輸出 collapsed stack (可用 flamegraph.pl / speedscope 開啟) 與摘要"""
+        stacks_path = f"{prefix}_stacks.txt"
+        with open(stacks_path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        per_thread: Counter[str] = Counter()
+        leaves: Counter[str] = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            per_thread[frames[0]] += count
+            leaves[f"{frames[0]}: {frames[-1]}"] += count
+
+        summary_path = f"{prefix}_summary.txt"
+        with open(summary_path, "w", encoding="utf-8") as f:
+            f.write(
+                f"samples: {self.samples}, interval: {self.interval * 1000:.1f} ms\n\n"
+            )
+            f.write("threads:\n")
+            for name, count in per_thread.most_common():
+                f.write(f"  {count:8d}  {name}\n")
+            f.write("\ntop frames:\n")
+            for frame, count in leaves.most_common(50):
+                f.write(f"  {count:8d}  {frame}\n")
+        return [stacks_path, summary_path]
+
+
+class Profiler:
+    def __init__(self, output_dir: str = "profiles"):
+        self.output_dir = output_dir
+        self.active = False
+        self.stopping = False
+        self.prefix = ""
+        self.outputs: list[str] = []
+        self.lock = threading.Lock()
+        self.sampler = StackSampler()
+        self.region_counts: Counter[str] = Counter()
+        self.sessions = 0
+        # torch.profiler 同時只能有一個在執行
+        self.torch_lock = threading.Lock()
+
+    def start(self) -> str:
+        with self.lock:
+            if self.active:
+                return self.prefix
+            if self.stopping:
+                return ""
+            os.makedirs(self.output_dir, exist_ok=True)
+            # 加上毫秒與序號，同一秒內重複開關也不會覆蓋先前的輸出
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
+            self.sessions += 1
+            self.prefix = os.path.join(
+                self.output_dir, f"profile_{timestamp}_{self.sessions:03d}"
+            )
+            self.outputs = []
+            self.region_counts.clear()
+
+            tracemalloc.start()
+            self.sampler.start()
+            self.active = True
+            print(f"效能分析已開始: {self.prefix}")
+            return self.prefix
+
+    def stop(self) -> list[str]:
+        """停止並寫出結果，會等待進行中的 torch.profiler 區塊，應在背景執行緒呼叫"""
+        with self.lock:
+            if not self.active or self.stopping:
+                return []
+            self.active = False
+            self.stopping = True
+            prefix = self.prefix
+
+        try:
+            self.sampler.stop()
+            outputs = self.sampler.write(prefix)
+
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            snapshot_path = f"{prefix}_tracemalloc.snapshot"
+            snapshot.dump(snapshot_path)
+            top_path = f"{prefix}_tracemalloc.txt"
+            with open(top_path, "w", encoding="utf-8") as f:
+                for stat in snapshot.statistics("lineno")[:50]:
+                    f.write(f"{stat}\n")
+            outputs.extend([snapshot_path, top_path])
+
+            # 等待進行中的 torch.profiler 區塊輸出 trace，之後的區塊不會再開始擷取
+            if self.torch_lock.acquire(timeout=30):
+                self.torch_lock.release()
+            else:
+                print("torch.profiler 區塊未在時間內結束，略過其 trace")
+
+            with self.lock:
+                self.outputs.extend(outputs)
+                result = list(self.outputs)
+        finally:
+            with self.lock:
+                self.stopping = False
+
+        print(f"效能分析已停止，輸出 {len(result)} 個檔案")
+        return result
+
+    def toggle(self) -> bool:
+        """切換開關，回傳切換後是否為開啟狀態"""
+        if self.active:
+            self.stop()
+        else:
+            self.start()
+        return self.active
+
+    def torch_region(self, name: str):
+        """在 torch.profiler 下執行區塊，未開啟效能分析時不做任何事"""
+        if not self.active:
+            return _NULL_CONTEXT
+        return self._torch_trace(name)
+
+    @contextlib.contextmanager
+    def _torch_trace(self, name: str):
+        if not self.torch_lock.acquire(blocking=False):
+            yield
+            return
+        try:
+            if not self.active:
+                # 取得 lock 前效能分析已停止
+                yield
+                return
+            with self._torch_profile(name):
+                yield
+        finally:
+            self.torch_lock.release()
+
+    @contextlib.contextmanager
+    def _torch_profile(self, name: str):
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+
+        with self.lock:
+            self.region_counts[name] += 1
+            path = f"{self.prefix}_{name}_{self.region_counts[name]:04d}.json"
+
+        with torch.profiler.profile(activities=activities, record_shapes=True) as prof:
+            with torch.profiler.record_function(name):
+                yield
+        prof.export_chrome_trace(path)
+        with self.lock:
+            self.outputs.append(path)
+
+    def install_signal_handler(self, signum: int | None = None):
+        """以訊號 (預設 SIGUSR1) 切換效能分析，供無介面執行時使用"""
+        signum = signum or getattr(signal, "SIGUSR1", None)
+        if signum is None:
+            return
+        # 在獨立執行緒中切換，避免訊號中斷持有 lock 的主執行緒時發生死結
+        signal.signal(
+            signum, lambda *_: threading.Thread(target=self.toggle, daemon=True).start()
+        )
+
+
+profiler = Profiler()
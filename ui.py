@@ -68,6 +68,7 @@ class VoiceToTextApp(App):
     BINDINGS = [
         Binding("ctrl+q", "quit", "退出程式"),
         Binding("ctrl+c", "quit", "退出程式"),
+        Binding("f8", "toggle_profiling", "效能分析"),
     ]
 
     def __init__(self, *args, **kwargs):
@@ -77,6 +78,7 @@ class VoiceToTextApp(App):
         self.emotion_enabled = True
         self.on_settings_changed = None
         self.on_input_submitted = None
+        self.on_toggle_profiling = None
 
     def compose(self) -> ComposeResult:
         yield Header()
@@ -154,6 +156,11 @@ class VoiceToTextApp(App):
         if self.on_settings_changed:
             self.on_settings_changed(setting_name, value)
 
+    def action_toggle_profiling(self) -> None:
+        """切換效能分析"""
+        if self.on_toggle_profiling:
+            self.on_toggle_profiling()
+
     @on(Input.Submitted)
     def handle_input_submitted(self, event: Input.Submitted) -> None:
         if event.value.strip():
@@ -165,9 +172,10 @@ class VoiceToTextApp(App):
             if self.on_input_submitted:
                 self.on_input_submitted(event.value)
 
-    def add_speech_text(self, text: str) -> None:
+    def add_speech_text(self, text: str, source: str | None = None) -> None:
         speech_log = self.query_one("#speech-log")
-        speech_log.write(f"[bold yellow]語音[/bold yellow]: {text}")
+        label = f"語音:{source}" if source else "語音"
+        speech_log.write(f"[bold yellow]{label}[/bold yellow]: {text}")
 
     def add_system_message(self, message: str) -> None:
         """顯示系統訊息"""
@@ -1,5 +1,4 @@
 import pyaudio
-import whisper
 import asyncio
 import numpy as np
 import queue
@@ -9,6 +8,13 @@ import torch
 import wave
 import os
 from datetime import datetime
+from asr import WhisperEngine
+from profiling import profiler
+
+
+def pcm_to_float32(audio_data: bytes) -> np.ndarray:
+    """將 16-bit PCM 轉為 whisper 使用的 [-1, 1] float32"""
+    return np.frombuffer(audio_data, dtype=np.int16).astype(np.float32) / 32768.0
 
 
 class VoiceStream:
@@ -18,7 +24,12 @@ class VoiceStream:
         language: str = "zh",
         save_audio: bool = False,
         save_dir: str = "voice_samples",
+        source: str = "mic",
+        device_index: int = 0,
+        engine: Optional[WhisperEngine] = None,
     ):
+        self.source = source
+        self.device_index = device_index
         self.chunk = 1024
         self.format = pyaudio.paInt16
         self.channels = 1
@@ -32,7 +43,9 @@ class VoiceStream:
         self.frames = []
         self.stream_thread = None
 
-        self.model = whisper.load_model(model_name)
+        # 未指定共用引擎時自行載入模型
+        self.owns_engine = engine is None
+        self.engine = engine or WhisperEngine(model_name)
         self.callback = None
         self.language = language
         self.save_audio = save_audio
@@ -42,12 +55,7 @@ class VoiceStream:
 
         torch.set_num_threads(1)
 
-        self.vad_model, utils = torch.hub.load(
-            repo_or_dir="snakers4/silero-vad",
-            model="silero_vad",
-            force_reload=True,
-        )
-        self.get_speech_timestamps = utils[0]
+        self.vad_model, self.get_speech_timestamps = self._load_vad()
 
         self.vad_threshold = 0.6
         self.min_silence_ms = 800
@@ -62,22 +70,30 @@ class VoiceStream:
         self.recent_transcriptions = []
         self.max_context_length = 5
 
-    def start_stream(self, callback: Optional[Callable[[str], None]] = None):
+    def _load_vad(self):
+        vad_model, utils = torch.hub.load(
+            repo_or_dir="snakers4/silero-vad",
+            model="silero_vad",
+            force_reload=True,
+        )
+        return vad_model, utils[0]
+
+    def start_stream(self, callback: Optional[Callable[[str, str], None]] = None):
         self.callback = callback
         self.pyaudio = pyaudio.PyAudio()
 
-        device_index = 0
-
         self.stream = self.pyaudio.open(
             format=self.format,
             channels=self.channels,
             rate=self.rate,
             input=True,
-            input_device_index=device_index,
+            input_device_index=self.device_index,
             frames_per_buffer=self.chunk,
         )
         self.is_running = True
-        self.stream_thread = threading.Thread(target=self._process_audio)
+        self.stream_thread = threading.Thread(
+            target=self._process_audio, name=f"capture-{self.source}"
+        )
         self.stream_thread.daemon = True
         self.stream_thread.start()
 
@@ -85,60 +101,61 @@ class VoiceStream:
         while self.is_running:
             try:
                 audio_data = self.stream.read(self.chunk, exception_on_overflow=False)
-                audio_array = np.frombuffer(audio_data, dtype=np.int16)
-                self.audio_buffer.extend(audio_array)
-
-                if len(self.audio_buffer) > self.buffer_max_len:
-                    self.audio_buffer = self.audio_buffer[-self.buffer_max_len :]
-
-                if len(self.audio_buffer) >= self.rate // 2:
-                    tensor_data = torch.FloatTensor(self.audio_buffer) / 32768.0
-                    speech_timestamps = self.get_speech_timestamps(
-                        tensor_data,
-                        self.vad_model,
-                        threshold=self.vad_threshold,
-                        return_seconds=False,
-                        min_speech_duration_ms=300,
-                        min_silence_duration_ms=self.min_silence_ms,
-                    )
-
-                    if speech_timestamps:
-                        if not self.is_speaking:
-                            self.is_speaking = True
-                            self.frames = []
-                            print("語音開始")
-                            self.frames.append(audio_data)
-                        self.silence_counter = 0
-                        self.frames.append(audio_data)
-                    else:
-                        if self.is_speaking:
-                            self.silence_counter += 1
-                            self.frames.append(audio_data)
-
-                            actual_silence_sec = (
-                                self.silence_counter * self.chunk
-                            ) / self.rate
-                            if actual_silence_sec > self.min_silence_ms / 1000:
-                                self.is_speaking = False
-                                print(f"語音結束 (靜音 {actual_silence_sec:.2f} 秒)")
-
-                                if len(self.frames) > 5:
-                                    audio_segment = b"".join(self.frames)
-                                    self.audio_queue.put(audio_segment)
-
-                                    if self.save_audio:
-                                        self._save_audio_sample(audio_segment)
-
-                                self.frames = []
-
-                    self.audio_buffer = self.audio_buffer[-self.rate // 2 :]
-
+                self._process_chunk(audio_data)
             except Exception as e:
                 print(f"讀取聲音出錯: {e}")
 
+    def _process_chunk(self, audio_data: bytes):
+        """對單一音訊區塊做 VAD，語音結束時將整段放入 audio_queue"""
+        audio_array = np.frombuffer(audio_data, dtype=np.int16)
+        self.audio_buffer.extend(audio_array)
+
+        if len(self.audio_buffer) > self.buffer_max_len:
+            self.audio_buffer = self.audio_buffer[-self.buffer_max_len :]
+
+        if len(self.audio_buffer) >= self.rate // 2:
+            tensor_data = torch.FloatTensor(self.audio_buffer) / 32768.0
+            speech_timestamps = self.get_speech_timestamps(
+                tensor_data,
+                self.vad_model,
+                threshold=self.vad_threshold,
+                return_seconds=False,
+                min_speech_duration_ms=300,
+                min_silence_duration_ms=self.min_silence_ms,
+            )
+
+            if speech_timestamps:
+                if not self.is_speaking:
+                    self.is_speaking = True
+                    self.frames = []
+                    print("語音開始")
+                    self.frames.append(audio_data)
+                self.silence_counter = 0
+                self.frames.append(audio_data)
+            else:
+                if self.is_speaking:
+                    self.silence_counter += 1
+                    self.frames.append(audio_data)
+
+                    actual_silence_sec = (self.silence_counter * self.chunk) / self.rate
+                    if actual_silence_sec > self.min_silence_ms / 1000:
+                        self.is_speaking = False
+                        print(f"語音結束 (靜音 {actual_silence_sec:.2f} 秒)")
+
+                        if len(self.frames) > 5:
+                            audio_segment = b"".join(self.frames)
+                            self.audio_queue.put(audio_segment)
+
+                            if self.save_audio:
+                                self._save_audio_sample(audio_segment)
+
+                        self.frames = []
+
+            self.audio_buffer = self.audio_buffer[-self.rate // 2 :]
+
     def _save_audio_sample(self, audio_data):
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = os.path.join(self.save_dir, f"sample_{timestamp}.wav")
+        filename = os.path.join(self.save_dir, f"sample_{self.source}_{timestamp}.wav")
 
         with wave.open(filename, "wb") as wf:
             wf.setnchannels(self.channels)
@@ -146,29 +163,23 @@ class VoiceStream:
             wf.setframerate(self.rate)
             wf.writeframes(audio_data)
 
+    def _context_prompt(self) -> Optional[str]:
+        """以最近的辨識結果作為解碼提示，讓人名與用詞在前後句之間保持一致"""
+        if not self.recent_transcriptions:
+            return None
+        return " ".join(self.recent_transcriptions)
+
     async def process_speech(self):
         while self.is_running:
             try:
                 if not self.audio_queue.empty():
                     audio_data = self.audio_queue.get()
-                    audio_np = (
-                        np.frombuffer(audio_data, dtype=np.int16).astype(np.float32)
-                        / 32768.0
-                    )
+                    audio_np = pcm_to_float32(audio_data)
 
-                    loop = asyncio.get_running_loop()
-                    result = await loop.run_in_executor(
-                        None,
-                        lambda: self.model.transcribe(
-                            audio_np,
-                            language=self.language,
-                            word_timestamps=True,
-                            best_of=5,
-                            temperature=0.0,
-                        ),
+                    text = await self.engine.transcribe(
+                        audio_np, self._context_prompt(), self.language
                     )
-
-                    text = result["text"].strip()
+                    text = text.strip()
                     if text:
                         self.recent_transcriptions.append(text)
 
@@ -177,7 +188,7 @@ class VoiceStream:
                         ]
 
                         if self.callback:
-                            self.callback(text)
+                            self.callback(text, self.source)
 
                 await asyncio.sleep(0.1)
             except Exception as e:
@@ -194,12 +205,14 @@ class VoiceStream:
             self.stream.close()
         if self.pyaudio:
             self.pyaudio.terminate()
+        if self.owns_engine:
+            self.engine.stop()
         print("已停止")
 
 
 async def main():
-    def on_speech_detected(text):
-        print(f"偵測到語音: {text}")
+    def on_speech_detected(text, source):
+        print(f"偵測到語音 [{source}]: {text}")
 
     voice = VoiceStream(
         model_name="large-v3-turbo",
@@ -208,6 +221,7 @@ async def main():
         save_dir="voice_samples",
     )
 
+    profiler.install_signal_handler()
     voice.start_stream(callback=on_speech_detected)
 
     try: